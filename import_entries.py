@@ -13,6 +13,13 @@ from pathlib import Path
 from sqlite3 import Connection
 from typing import Any
 
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 
 def command_parse() -> Namespace:
     """Parse command arguments and options."""
@@ -54,10 +61,7 @@ def get_entries(json_file: str) -> list[dict[str, Any]] | None:
         print(f"ERROR: Podcast feed JSON database file {json_file} not found.")
         sys.exit(1)
 
-    with json_file_path.open(mode="r", encoding="utf-8") as input_file:
-        entries = json.load(input_file)
-
-    return entries
+    return _json_loads(json_file_path.read_bytes())
 
 
 def create_database(db_file: str) -> None:
@@ -96,7 +100,13 @@ def import_entries(
         create_database(db_file=db_file)
 
     database: Connection = sqlite3.connect(db_file)
-    database.executemany("INSERT INTO episodes VALUES(?, ?, ?, ?)", data)
+    database.executemany(
+        (
+            "INSERT INTO episodes (podcast_name, guid, enclosure_url, processed) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING"
+        ),
+        data,
+    )
     database.commit()
     return
 
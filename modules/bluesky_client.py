@@ -6,10 +6,16 @@
 """Bluesky Client Module."""
 
 import sqlite3
+import threading
 from pathlib import Path
 from sqlite3 import Connection, Cursor
 
-from atproto import Client, client_utils
+from atproto import Client, models
+
+from modules.database import apply_pragmas
+
+_LINK_TEXT: str = "Episode Download"
+_LINK_TEXT_LENGTH: int = len(_LINK_TEXT.encode("utf-8"))
 
 
 class BlueskyClientSession:
@@ -17,19 +23,25 @@ class BlueskyClientSession:
 
     def __init__(self, session_file: str = None) -> None:
         """Class initialization method."""
-        if session_file and not Path(session_file).exists():
-            self.initialize(session_file)
-            self.connection: Connection = sqlite3.connect(session_file)
-        if session_file and Path(session_file).exists():
-            self.connection: Connection = sqlite3.connect(session_file)
-            self._migrate()
+        # Session tokens can be saved from threads posting episodes, so
+        # access to the connection is serialized.
+        self._lock: threading.Lock = threading.Lock()
+        if session_file:
+            _new_database: bool = not Path(session_file).exists()
+            if _new_database:
+                self.initialize(session_file)
+
+            self.connection: Connection = sqlite3.connect(
+                session_file, check_same_thread=False
+            )
+            apply_pragmas(self.connection)
+            if not _new_database:
+                self._migrate()
 
     def initialize(self, db_file: str) -> None:
-        """Initialize feed database with the required table."""
-        if Path(db_file).exists():
-            return
-
+        """Initialize a new session database with the required table."""
         database: Connection = sqlite3.connect(db_file)
+        apply_pragmas(database)
         database.execute(
             "CREATE TABLE bluesky_sessions(username str PRIMARY KEY, session_token str)"
         )
@@ -39,19 +51,33 @@ class BlueskyClientSession:
     def _migrate(self) -> None:
         """Run any required database migration steps."""
 
+    def __enter__(self) -> "BlueskyClientSession":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Optimize and close the connection to the session database."""
+        if hasattr(self, "connection"):
+            self.connection.execute("PRAGMA optimize")
+            self.connection.close()
+
     def connect(self, session_file: str) -> None:
         """Returns a connection to the feed database."""
         if Path(session_file).exists():
-            self.connection = sqlite3.connect(session_file)
+            self.connection = sqlite3.connect(session_file, check_same_thread=False)
+            apply_pragmas(self.connection)
 
     def retrieve(self, username: str) -> str | None:
         """Retrieve stored Bluesky client session token."""
         if username:
-            result: Cursor = self.connection.execute(
-                "SELECT session_token FROM bluesky_sessions WHERE username = ? LIMIT 1",
-                (username,),
-            )
-            _token = result.fetchone()
+            with self._lock:
+                result: Cursor = self.connection.execute(
+                    "SELECT session_token FROM bluesky_sessions WHERE username = ? LIMIT 1",
+                    (username,),
+                )
+                _token = result.fetchone()
 
             if _token:
                 return _token[0]
@@ -63,18 +89,19 @@ class BlueskyClientSession:
     def save(self, username: str, session_token: str) -> None:
         """Update or insert Bluesky client session token."""
         if username and session_token:
-            self.connection.execute(
-                """
-                INSERT INTO bluesky_sessions (username, session_token)
-                VALUES (?, ?)
-                ON CONFLICT (username) DO
-                UPDATE
-                SET username = excluded.username,
-                session_token = excluded.session_token
-                """,
-                (username, session_token),
-            )
-            self.connection.commit()
+            with self._lock:
+                self.connection.execute(
+                    """
+                    INSERT INTO bluesky_sessions (username, session_token)
+                    VALUES (?, ?)
+                    ON CONFLICT (username) DO
+                    UPDATE
+                    SET username = excluded.username,
+                    session_token = excluded.session_token
+                    """,
+                    (username, session_token),
+                )
+                self.connection.commit()
 
 
 class BlueskyClient:
@@ -92,6 +119,10 @@ class BlueskyClient:
         self._session_file: str = session_file
         self._username: str = username
         self._use_session_token: bool = use_session_token
+        self._session: BlueskyClientSession | None = None
+
+        if use_session_token and session_file:
+            self._session = BlueskyClientSession(session_file=session_file)
 
         if api_url and username and app_password:
             self.login(
@@ -118,8 +149,10 @@ class BlueskyClient:
 
         self._client = Client(base_url=api_url)
         if use_session_token:
-            _session = BlueskyClientSession(session_file=session_file)
-            _session_token: str | None = _session.retrieve(username=username)
+            if not self._session:
+                self._session = BlueskyClientSession(session_file=session_file)
+
+            _session_token: str | None = self._session.retrieve(username=username)
 
             if _session_token:
                 self._client.login(session_string=_session_token)
@@ -128,17 +161,68 @@ class BlueskyClient:
 
     def post(self, body: str, episode_url: str) -> None:
         """Log into Bluesky and publish a new post."""
-        _post: client_utils.TextBuilder = (
-            client_utils.TextBuilder()
-            .text(body)
-            .text("\n")
-            .link(text="Episode Download", url=episode_url)
+        # Facet indexes are byte offsets into the UTF-8 encoded post text
+        _link_start: int = len(body.encode("utf-8")) + 1
+        _link: models.AppBskyRichtextFacet.Main = models.AppBskyRichtextFacet.Main(
+            index=models.AppBskyRichtextFacet.ByteSlice(
+                byte_start=_link_start, byte_end=_link_start + _LINK_TEXT_LENGTH
+            ),
+            features=[models.AppBskyRichtextFacet.Link(uri=episode_url)],
         )
-        _ = self._client.send_post(text=_post)
+        _ = self._client.send_post(text=f"{body}\n{_LINK_TEXT}", facets=[_link])
 
     def save_session(self) -> None:
         """Save session token for current user."""
-        if self._use_session_token:
-            _session = BlueskyClientSession(session_file=self._session_file)
+        if self._use_session_token and self._session:
             _session_token = self._client.export_session_string()
-            _session.save(username=self._username, session_token=_session_token)
+            self._session.save(username=self._username, session_token=_session_token)
+
+    def close(self) -> None:
+        """Close the session database connection, if one is open."""
+        if self._session:
+            self._session.close()
+            self._session = None
+
+
+_CLIENT_CACHE: dict[tuple[str, str, str, bool], BlueskyClient] = {}
+_CLIENT_CACHE_LOCK: threading.Lock = threading.Lock()
+
+
+def get_client(
+    api_url: str,
+    username: str,
+    app_password: str,
+    session_file: str,
+    use_session_token: bool,
+) -> BlueskyClient:
+    """Return a cached Bluesky client for an account, creating one if needed.
+
+    Clients are cached per account and session settings, so feeds using the
+    same account with different session settings get separate clients.
+    """
+    _key: tuple[str, str, str, bool] = (
+        api_url,
+        username,
+        session_file,
+        use_session_token,
+    )
+    with _CLIENT_CACHE_LOCK:
+        if _key not in _CLIENT_CACHE:
+            _CLIENT_CACHE[_key] = BlueskyClient(
+                api_url=api_url,
+                username=username,
+                app_password=app_password,
+                session_file=session_file,
+                use_session_token=use_session_token,
+            )
+
+        return _CLIENT_CACHE[_key]
+
+
+def close_clients() -> None:
+    """Close and remove all cached Bluesky clients."""
+    with _CLIENT_CACHE_LOCK:
+        for _client in _CLIENT_CACHE.values():
+            _client.close()
+
+        _CLIENT_CACHE.clear()
@@ -6,10 +6,12 @@
 """Application Command-Line Parsing Module."""
 
 from argparse import ArgumentParser, Namespace
+from functools import lru_cache
 
 
-def parse() -> Namespace:
-    """Parse command-line arguments, options and flags using ArgumentParser."""
+@lru_cache(maxsize=1)
+def _build_parser() -> ArgumentParser:
+    """Build the command-line ArgumentParser."""
     parser: ArgumentParser = ArgumentParser(
         description=(
             "Fetch items from a podcast feed and publish new items "
@@ -19,7 +21,6 @@ def parse() -> Namespace:
     parser.add_argument(
         "-s",
         "--settings",
-        type=str,
         default="settings.json",
         help="Application settings file (default: settings.json)",
     )
@@ -42,4 +43,9 @@ def parse() -> Namespace:
         help="Prints out the version of the application and exits.",
     )
 
-    return parser.parse_args()
+    return parser
+
+
+def parse() -> Namespace:
+    """Parse command-line arguments, options and flags using ArgumentParser."""
+    return _build_parser().parse_args()
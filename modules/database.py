@@ -7,6 +7,9 @@
 
 import datetime
 import sqlite3
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from functools import wraps
 from pathlib import Path
 from sqlite3 import Connection, Cursor
 from typing import Any
@@ -14,120 +17,284 @@ from typing import Any
 from dateutil import parser
 from dateutil.parser import ParserError
 
+_SCHEMA_VERSION: int = 5
+
+# Maximum number of values bound in a single IN (...) lookup, kept below the
+# SQLite host parameter limit of older SQLite versions.
+_LOOKUP_BATCH_SIZE: int = 500
+
+_PRAGMAS: str = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+PRAGMA cache_size = -64000;
+PRAGMA temp_store = MEMORY;
+PRAGMA mmap_size = 268435456;
+"""
+
+# SQLite treats NULL values as distinct in unique indexes, so a missing
+# enclosure URL is indexed as an empty string for episodes recorded without one
+# to be deduplicated.
+_CREATE_UNIQUE_INDEX_SQL: str = (
+    "CREATE UNIQUE INDEX ux_episodes_podcast_guid_enclosure "
+    "ON episodes(podcast_name, guid, IFNULL(enclosure_url, ''))"
+)
+
+# Statements run for every processed feed or episode are kept as constants so
+# that the same SQL text, and the connection's cached prepared statement, is
+# reused across calls.
+_INSERT_EPISODE_SQL: str = (
+    "INSERT INTO episodes (guid, enclosure_url, podcast_name, processed) "
+    "VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING"
+)
+_INSERT_EPISODE_NO_URL_SQL: str = (
+    "INSERT INTO episodes (guid, podcast_name, processed) "
+    "VALUES (?, ?, ?) ON CONFLICT DO NOTHING"
+)
+_SELECT_LAST_MODIFIED_SQL: str = (
+    "SELECT last_modified FROM feeds WHERE podcast_name = ?"
+)
+_SELECT_ETAG_SQL: str = "SELECT etag FROM feeds WHERE podcast_name = ?"
+_UPSERT_FEED_SQL: str = (
+    "INSERT INTO feeds (podcast_name, last_modified, etag) VALUES (?, ?, ?) "
+    "ON CONFLICT (podcast_name) DO UPDATE "
+    "SET last_modified = excluded.last_modified, etag = excluded.etag"
+)
+
+
+def _adapt_datetime(value: datetime.datetime) -> str:
+    """Convert a datetime object to an ISO 8601 string for storage."""
+    return value.isoformat(sep=" ")
+
+
+def _convert_timestamp(value: bytes) -> datetime.datetime:
+    """Convert a stored ISO 8601 timestamp to a datetime object."""
+    return datetime.datetime.fromisoformat(value.decode())
+
+
+sqlite3.register_adapter(datetime.datetime, _adapt_datetime)
+sqlite3.register_converter("TIMESTAMP", _convert_timestamp)
+
+
+def apply_pragmas(connection: Connection) -> None:
+    """Apply performance-related PRAGMA settings to a database connection."""
+    connection.executescript(_PRAGMAS)
+
+
+def _synchronized(method: Callable) -> Callable:
+    """Serialize calls to a database method using the instance lock."""
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
 
 class FeedDatabase:
     """Feed Database Access."""
 
-    _timestamp = datetime.datetime.now(datetime.timezone.utc)
-
     def __init__(self, db_file: str = None) -> None:
         """Class initialization method."""
-        if db_file and not Path(db_file).exists():
-            self.initialize(db_file)
-            self.connection: Connection = sqlite3.connect(db_file)
-        if db_file and Path(db_file).exists():
-            self.connection: Connection = sqlite3.connect(db_file)
-            self._migrate()
+        # The database connection is shared by threads processing feeds
+        # concurrently, so access to the connection is serialized.
+        self._lock: threading.RLock = threading.RLock()
 
-    def initialize(self, db_file: str) -> None:
-        """Initialize feed database with the required table."""
-        if Path(db_file).exists():
-            return
+        if db_file:
+            _new_database: bool = not Path(db_file).exists()
+            if _new_database:
+                self.initialize(db_file)
 
+            self.connection: Connection = sqlite3.connect(
+                db_file, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False
+            )
+            apply_pragmas(self.connection)
+            if not _new_database:
+                self._migrate()
+
+    def initialize(self, db_file: str) -> None:
+        """Initialize a new feed database with the required tables."""
         database: Connection = sqlite3.connect(db_file)
+        # Page size can only be changed before the first table is created
+        # and before the database is switched to WAL journaling.
+        database.execute("PRAGMA page_size = 8192")
+        apply_pragmas(database)
+        database.execute(
+            "CREATE TABLE episodes(podcast_name str, guid str, enclosure_url str, "
+            "processed TIMESTAMP)"
+        )
+        database.execute(_CREATE_UNIQUE_INDEX_SQL)
+        database.execute("CREATE INDEX idx_episodes_processed ON episodes(processed)")
+        database.execute(
+            "CREATE INDEX idx_episodes_podcast_url ON episodes(podcast_name, enclosure_url)"
+        )
+        database.execute(
+            "CREATE TABLE feeds(podcast_name str PRIMARY KEY, last_modified TIMESTAMP, "
+            "etag str)"
+        )
         database.execute(
-            "CREATE TABLE episodes(podcast_name str, guid str, enclosure_url str, processed str)"
+            "CREATE TABLE bluesky_sessions(username str PRIMARY KEY, session_token str)"
         )
+        database.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
         database.commit()
         database.close()
 
     def _migrate(self) -> None:
         """Run any required database migration steps."""
-        # Add a enclosure_url column to the episodes table if the column
-        # does not exist.
-        cursor: Cursor = self.connection.execute(
-            "SELECT name FROM pragma_table_info('episodes') WHERE name = 'enclosure_url'"
-        )
+        # Skip migration steps if the database schema is up to date.
+        cursor: Cursor = self.connection.execute("PRAGMA user_version")
         result = cursor.fetchone()
         cursor.close()
-        if not result:
-            self.connection.execute("ALTER TABLE episodes ADD COLUMN enclosure_url str")
-            self.connection.commit()
+        if result and result[0] >= _SCHEMA_VERSION:
+            return
 
-        # Add the podcast_name column to the episodes table if the
-        # column does not exist.
-        cursor: Cursor = self.connection.execute(
-            "SELECT name FROM pragma_table_info('episodes') WHERE name = 'podcast_name'"
-        )
-        result = cursor.fetchone()
-        cursor.close()
-        if not result:
-            self.connection.execute("ALTER TABLE episodes ADD COLUMN podcast_name str")
-            self.connection.commit()
+        columns: set[str] = {
+            column[1]
+            for column in self.connection.execute("PRAGMA table_info(episodes)")
+        }
+        feeds_columns: set[str] = {
+            column[1] for column in self.connection.execute("PRAGMA table_info(feeds)")
+        }
+        schema_objects: set[str] = {
+            item[0]
+            for item in self.connection.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'index')"
+            )
+        }
+        create_indexes: bool = not {
+            "ux_episodes_podcast_guid_enclosure",
+            "idx_episodes_processed",
+            "idx_episodes_podcast_url",
+        }.issubset(schema_objects)
 
-        # Create the feeds table for storing podcast feed last modified
-        # timestamp if the table does not exist.
-        cursor: Cursor = self.connection.execute(
-            "SELECT EXISTS (SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'feeds')"
-        )
-        result = cursor.fetchone()
-        cursor.close()
+        with self.connection:
+            self.connection.execute("BEGIN")
 
-        if result and result[0] == 0:
-            self.connection.execute(
-                "CREATE TABLE feeds(podcast_name str PRIMARY KEY, last_modified str)"
-            )
-            self.connection.commit()
+            # Add a enclosure_url column to the episodes table if the column
+            # does not exist.
+            if "enclosure_url" not in columns:
+                self.connection.execute(
+                    "ALTER TABLE episodes ADD COLUMN enclosure_url str"
+                )
 
-        # Create the bluesky_sessions table for storing session tokens if
-        # the table does not exist.
-        cursor: Cursor = self.connection.execute(
-            "SELECT EXISTS (SELECT name from sqlite_master WHERE type = 'table' AND "
-            "name = 'bluesky_sessions')"
-        )
-        result = cursor.fetchone()
-        cursor.close()
+            # Add the podcast_name column to the episodes table if the
+            # column does not exist.
+            if "podcast_name" not in columns:
+                self.connection.execute(
+                    "ALTER TABLE episodes ADD COLUMN podcast_name str"
+                )
 
-        if result and result[0] == 0:
-            self.connection.execute(
-                "CREATE TABLE bluesky_sessions(username str PRIMARY KEY, session_token str)"
-            )
-            self.connection.commit()
+            # Create the feeds table for storing podcast feed last modified
+            # timestamp and ETag if the table does not exist, or add the etag
+            # column to an existing feeds table.
+            if "feeds" not in schema_objects:
+                self.connection.execute(
+                    "CREATE TABLE feeds(podcast_name str PRIMARY KEY, "
+                    "last_modified TIMESTAMP, etag str)"
+                )
+            elif "etag" not in feeds_columns:
+                self.connection.execute("ALTER TABLE feeds ADD COLUMN etag str")
+
+            # Create the bluesky_sessions table for storing session tokens if
+            # the table does not exist.
+            if "bluesky_sessions" not in schema_objects:
+                self.connection.execute(
+                    "CREATE TABLE bluesky_sessions(username str PRIMARY KEY, "
+                    "session_token str)"
+                )
+
+            # Create indexes used for episode lookups and clean up if the
+            # indexes do not exist.
+            if create_indexes:
+                # Remove duplicate episode entries before creating the unique
+                # index, which replaces the podcast name and GUID indexes
+                # created by earlier versions. Duplicate entries without an
+                # enclosure URL were not caught by the previous unique index.
+                # Entries are grouped on the same expression as the index.
+                if "ux_episodes_podcast_guid_enclosure" not in schema_objects:
+                    self.connection.execute(
+                        "DELETE FROM episodes WHERE rowid NOT IN (SELECT MIN(rowid) "
+                        "FROM episodes GROUP BY podcast_name, guid, "
+                        "IFNULL(enclosure_url, ''))"
+                    )
+                    self.connection.execute(_CREATE_UNIQUE_INDEX_SQL)
+                    self.connection.execute(
+                        "DROP INDEX IF EXISTS ux_episodes_podcast_guid_url"
+                    )
+                    self.connection.execute(
+                        "DROP INDEX IF EXISTS idx_episodes_podcast_guid"
+                    )
+
+                self.connection.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_episodes_processed "
+                    "ON episodes(processed)"
+                )
+                self.connection.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_episodes_podcast_url "
+                    "ON episodes(podcast_name, enclosure_url)"
+                )
+
+            self.connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
 
+        # Update the query planner statistics for the new indexes.
+        if create_indexes:
+            self.connection.execute("ANALYZE")
+
+    @_synchronized
     def connect(self, db_file: str) -> None:
         """Returns a connection to the feed database."""
         if Path(db_file).exists():
-            self.connection = sqlite3.connect(db_file)
+            self.connection = sqlite3.connect(
+                db_file, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False
+            )
+            apply_pragmas(self.connection)
 
+    @_synchronized
+    def close(self) -> None:
+        """Optimize and close the connection to the feed database."""
+        self.connection.execute("PRAGMA optimize")
+        self.connection.close()
+
+    @_synchronized
     def insert(
         self,
         guid: str,
         enclosure_url: str = None,
         feed_name: str = None,
-        timestamp: datetime.datetime = _timestamp,
+        timestamp: datetime.datetime | None = None,
     ) -> None:
         """Insert feed episode GUID into the feed database with a timestamp.
 
-        Default: current date/time.
+        Default: current date/time in UTC.
         """
-        if enclosure_url:
-            self.connection.execute(
-                (
-                    "INSERT INTO episodes (guid, enclosure_url, podcast_name, "
-                    "processed) VALUES (?, ?, ?, ?)"
-                ),
-                (guid, enclosure_url, feed_name, timestamp),
-            )
-            self.connection.commit()
-        else:
-            self.connection.execute(
-                (
-                    "INSERT INTO episodes (guid, podcast_name, processed) VALUES (?, ?, ?)"
-                ),
-                (guid, feed_name, timestamp),
-            )
-            self.connection.commit()
+        timestamp = timestamp or datetime.datetime.now(datetime.timezone.utc)
+        with self.connection:
+            if enclosure_url:
+                self.connection.execute(
+                    _INSERT_EPISODE_SQL, (guid, enclosure_url, feed_name, timestamp)
+                )
+            else:
+                self.connection.execute(
+                    _INSERT_EPISODE_NO_URL_SQL, (guid, feed_name, timestamp)
+                )
 
+    @_synchronized
+    def insert_many(
+        self, episodes: list[tuple[str, str | None, str, datetime.datetime]]
+    ) -> None:
+        """Insert multiple feed episodes in a single transaction.
+
+        Each episode is a tuple containing the GUID, enclosure URL, feed
+        name and processed timestamp. Episodes that are already stored
+        with the same feed name, GUID and enclosure URL are skipped.
+        """
+        if not episodes:
+            return
+
+        with self.connection:
+            self.connection.executemany(_INSERT_EPISODE_SQL, episodes)
+
+    @_synchronized
     def retrieve(self, episode_guid: str, feed_name: str = None) -> dict[str, Any]:
         """Retrieve stored information for a specific episode GUID."""
         episode: dict[str, Any] = {}
@@ -146,53 +313,136 @@ class FeedDatabase:
 
         return episode
 
-    def retrieve_enclosure_urls(self, feed_name: str = None) -> list[str]:
+    @_synchronized
+    def retrieve_enclosure_urls(self, feed_name: str = None) -> set[str]:
         """Retrieve all episode enclosure URLs from the feed database."""
-        urls: list[str] = []
         if feed_name:
-            for url in self.connection.execute(
-                "SELECT DISTINCT enclosure_url FROM episodes WHERE enclosure_url "
-                "IS NOT NULL AND podcast_name = ?",
-                (feed_name,),
-            ):
-                urls.append(url[0])
+            urls: set[str] = {
+                url[0]
+                for url in self.connection.execute(
+                    "SELECT DISTINCT enclosure_url FROM episodes WHERE enclosure_url "
+                    "IS NOT NULL AND podcast_name = ?",
+                    (feed_name,),
+                )
+            }
         else:
-            for url in self.connection.execute(
-                "SELECT DISTINCT enclosure_url FROM episodes WHERE enclosure_url IS NOT NULL"
-            ):
-                urls.append(url[0])
+            urls: set[str] = {
+                url[0]
+                for url in self.connection.execute(
+                    "SELECT DISTINCT enclosure_url FROM episodes WHERE enclosure_url IS NOT NULL"
+                )
+            }
 
         return urls
 
-    def retrieve_guids(self, feed_name: str = None) -> list[str]:
+    def iter_guids(self, feed_name: str = None) -> Iterator[str]:
+        """Iterate over all episode GUIDs from the feed database.
+
+        Rows are fetched in batches to limit memory usage for large result
+        sets.
+        """
+        with self._lock:
+            if feed_name:
+                cursor: Cursor = self.connection.execute(
+                    "SELECT DISTINCT guid FROM episodes WHERE guid IS NOT NULL AND podcast_name = ?",
+                    (feed_name,),
+                )
+            else:
+                cursor: Cursor = self.connection.execute(
+                    "SELECT DISTINCT guid FROM episodes WHERE guid IS NOT NULL"
+                )
+
+        while True:
+            with self._lock:
+                rows: list[tuple] = cursor.fetchmany(1000)
+
+            if not rows:
+                break
+
+            for row in rows:
+                yield row[0]
+
+        cursor.close()
+
+    @_synchronized
+    def retrieve_guids(self, feed_name: str = None) -> set[str]:
         """Retrieve all episode GUIDs from the feed database."""
-        guids: list[str] = []
-        if feed_name:
-            for guid in self.connection.execute(
-                "SELECT DISTINCT guid FROM episodes WHERE guid IS NOT NULL AND podcast_name = ?",
-                (feed_name,),
-            ):
-                guids.append(guid[0])
-        else:
-            for guid in self.connection.execute(
-                "SELECT DISTINCT guid FROM episodes WHERE guid IS NOT NULL"
-            ):
-                guids.append(guid[0])
+        return set(self.iter_guids(feed_name=feed_name))
+
+    def _retrieve_existing(
+        self, column: str, values: list[str], feed_name: str = None
+    ) -> set[str]:
+        """Retrieve which of the given values are stored in an episodes column."""
+        existing: set[str] = set()
+        for index in range(0, len(values), _LOOKUP_BATCH_SIZE):
+            batch: list[str] = values[index : index + _LOOKUP_BATCH_SIZE]
+            placeholders: str = ", ".join("?" * len(batch))
+            if feed_name:
+                result: Cursor = self.connection.execute(
+                    f"SELECT {column} FROM episodes WHERE podcast_name = ? "
+                    f"AND {column} IN ({placeholders})",
+                    (feed_name, *batch),
+                )
+            else:
+                result: Cursor = self.connection.execute(
+                    f"SELECT {column} FROM episodes WHERE {column} IN ({placeholders})",
+                    batch,
+                )
 
-        return guids
+            existing.update(row[0] for row in result)
 
+        return existing
+
+    @_synchronized
+    def retrieve_seen(
+        self,
+        guids: Iterable[str],
+        enclosure_urls: Iterable[str],
+        feed_name: str = None,
+    ) -> tuple[set[str], set[str]]:
+        """Retrieve which of the given episode GUIDs and enclosure URLs are stored.
+
+        Only the given values are looked up, so the amount of data returned
+        is bounded by the size of the feed rather than the size of the
+        episode history.
+        """
+        return (
+            self._retrieve_existing(
+                column="guid", values=list(set(guids)), feed_name=feed_name
+            ),
+            self._retrieve_existing(
+                column="enclosure_url",
+                values=list(set(enclosure_urls)),
+                feed_name=feed_name,
+            ),
+        )
+
+    @_synchronized
     def get_last_modified(self, feed_name: str) -> datetime.datetime | None:
         """Get the last modified date stored for a feed."""
         if not feed_name:
             return None
 
         result: Cursor = self.connection.execute(
-            "SELECT last_modified FROM feeds WHERE podcast_name = ?", (feed_name,)
+            _SELECT_LAST_MODIFIED_SQL, (feed_name,)
         )
         _last_modified = result.fetchone()
         result.close()
 
-        if _last_modified:
+        if _last_modified and _last_modified[0]:
+            # Values in columns declared as TIMESTAMP are converted when
+            # retrieved. Databases created before the column type change
+            # return the stored string instead.
+            if isinstance(_last_modified[0], datetime.datetime):
+                return _last_modified[0]
+
+            try:
+                return datetime.datetime.fromisoformat(_last_modified[0])
+            except ValueError:
+                pass
+
+            # Fall back to the more lenient parser for values that are not
+            # stored in ISO 8601 format.
             try:
                 return parser.parse(_last_modified[0])
             except ParserError:
@@ -200,30 +450,55 @@ class FeedDatabase:
 
         return None
 
+    @_synchronized
+    def get_conditional_headers(self, feed_name: str) -> dict[str, Any]:
+        """Get the stored ETag and last modified date for a feed.
+
+        Returns a dictionary with "etag" and "modified" keys that can be used
+        to make a conditional request for the feed.
+        """
+        _etag: tuple | None = None
+        if feed_name:
+            result: Cursor = self.connection.execute(_SELECT_ETAG_SQL, (feed_name,))
+            _etag = result.fetchone()
+            result.close()
+
+        return {
+            "etag": _etag[0] if _etag else None,
+            "modified": self.get_last_modified(feed_name=feed_name),
+        }
+
+    @_synchronized
     def upsert_last_modified(
-        self, feed_name: str, last_modified: datetime.datetime = _timestamp
+        self,
+        feed_name: str,
+        last_modified: datetime.datetime | None = None,
+        etag: str | None = None,
     ):
-        """Update or insert feed last modified date."""
-        if feed_name and last_modified:
-            self.connection.execute(
-                """
-                INSERT INTO feeds (podcast_name, last_modified)
-                VALUES (?, ?)
-                ON CONFLICT (podcast_name) DO
-                UPDATE
-                SET podcast_name = excluded.podcast_name,
-                last_modified = excluded.last_modified
-                """,
-                (feed_name, last_modified),
-            )
+        """Update or insert feed last modified date and ETag.
+
+        The last modified date and ETag are stored as sent by the server,
+        including None if the server did not send either value.
+        """
+        if feed_name:
+            self.connection.execute(_UPSERT_FEED_SQL, (feed_name, last_modified, etag))
             self.connection.commit()
 
+    @_synchronized
     def clean(self, days_to_keep: int = 90) -> None:
         """Remove old episode entries from the database."""
-        datetime_filter: datetime.datetime = (
-            datetime.datetime.now() - datetime.timedelta(days=days_to_keep)
-        )
-        self.connection.execute(
-            "DELETE FROM episodes WHERE processed <= ?", (datetime_filter,)
-        )
-        self.connection.commit()
+        # Episode timestamps are stored as UTC ISO 8601 strings using a
+        # space separator, so the filter is bound in the same format to
+        # allow string comparison against the processed index.
+        datetime_filter: datetime.datetime = datetime.datetime.now(
+            datetime.timezone.utc
+        ) - datetime.timedelta(days=days_to_keep)
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM episodes WHERE processed <= ?",
+                (datetime_filter.isoformat(sep=" "),),
+            )
+            self.connection.execute("PRAGMA optimize")
+
+        # Reclaim space used by the write-ahead log after removing entries.
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
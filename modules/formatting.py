@@ -5,78 +5,120 @@
 # vim: set noai syntax=python ts=4 sw=4:
 """Post Formatting Module."""
 
+import re
 import unicodedata
 from datetime import timedelta
+from functools import lru_cache
 from string import Formatter
 from typing import Any
 
 from html2text import HTML2Text
 from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
 
-
-def unsmart_quotes(text: str) -> str:
-    """Replaces "smart" quotes with normal quotes."""
-    text: str = text.replace("’", "'")
-    text = text.replace("”", '"')
-    text = text.replace("“", '"')
-    return text
-
-
-def format_bluesky_post(
-    episode: dict[str, Any],
-    podcast_name: str,
-    max_title_length: int,
-    max_description_length: int,
-    template_path: str,
-    template_file: str,
-) -> str:
-    """Returns a formatted post with episode information."""
+_SMART_QUOTES: dict[int, str] = str.maketrans(
+    {"\u2019": "'", "\u201c": '"', "\u201d": '"'}
+)
+_ESCAPED_PLUS: re.Pattern = re.compile(r"\\\+")
+_TD_FORMATTER: Formatter = Formatter()
+_TD_CONSTANTS: tuple[tuple[str, int], ...] = (
+    ("W", 604800),
+    ("D", 86400),
+    ("H", 3600),
+    ("M", 60),
+    ("S", 1),
+)
+_TD_INPUT_MULTIPLIERS: dict[str, int] = {
+    "s": 1,
+    "seconds": 1,
+    "m": 60,
+    "minutes": 60,
+    "h": 3600,
+    "hours": 3600,
+    "d": 86400,
+    "days": 86400,
+    "w": 604800,
+    "weeks": 604800,
+}
+
+
+def _html_formatter() -> HTML2Text:
+    """Returns an HTML2Text formatter configured for episode descriptions.
+
+    HTML2Text keeps parser state, such as list nesting, between calls to
+    handle() when the HTML is not well-formed, so a new formatter is
+    created for each description.
+    """
     formatter: HTML2Text = HTML2Text()
     formatter.ignore_emphasis = True
     formatter.ignore_images = True
     formatter.ignore_links = True
     formatter.ignore_tables = True
     formatter.body_width = 0
+    return formatter
+
+
+@lru_cache(maxsize=8)
+def _get_environment(template_path: str) -> Environment:
+    """Returns a Jinja environment for a template directory.
 
-    env: Environment = Environment(
+    Templates are not expected to change while the application is running,
+    so automatic reloading is disabled to skip checking template files for
+    changes each time a template is retrieved.
+    """
+    return Environment(
         loader=FileSystemLoader(template_path),
         autoescape=select_autoescape(),
         trim_blocks=True,
         lstrip_blocks=True,
+        auto_reload=False,
     )
-    template: Template = env.get_template(template_file)
 
-    # Replace "smart" quotes with regular quotes
-    title: str = unsmart_quotes(text=episode["title"])
-    if len(title) > max_title_length:
-        title = f"{title[:max_title_length].strip()}..."
 
-    description: str = unsmart_quotes(text=episode["description"])
-    formatted_description: str = formatter.handle(description)
+@lru_cache(maxsize=8)
+def load_template(template_path: str, template_file: str) -> Template:
+    """Returns a compiled Jinja template, loading it on first use.
 
-    # Fix issue with HTML2Text causing + to be rendered as \+
-    formatted_description = formatted_description.replace(r"\+", "+")
+    Templates can be loaded ahead of formatting posts so that missing or
+    invalid templates are reported before any posts are published.
+    """
+    return _get_environment(template_path).get_template(template_file)
 
-    # Normalize formatted description
-    formatted_description = unicodedata.normalize("NFKC", formatted_description)
 
-    if len(formatted_description) > max_description_length:
-        formatted_description = (
-            f"{formatted_description[:max_description_length].strip()}...\n"
-        )
-    else:
-        formatted_description = f"{formatted_description.strip()}\n"
-
-    return template.render(
-        podcast_name=podcast_name,
-        title=title,
-        description=formatted_description,
-        total_time=episode["total_time"],
-        url=episode["url"],
+@lru_cache(maxsize=16)
+def _desired_fields(format_string: str) -> frozenset[str]:
+    """Returns the set of field names used in a timedelta format string."""
+    return frozenset(
+        field_tuple[1]
+        for field_tuple in _TD_FORMATTER.parse(format_string)
+        if field_tuple[1]
     )
 
 
-def format_mastodon_post(
+def unsmart_quotes(text: str) -> str:
+    """Replaces "smart" quotes with normal quotes."""
+    if text.isascii():
+        return text
+
+    return text.translate(_SMART_QUOTES)
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Returns text truncated to a maximum length, ending with a new line.
+
+    Text that is longer than the limit is cut at the last space before the
+    limit, unless that would drop more than half of the allowed text.
+    """
+    if len(text) <= limit:
+        return text.strip() + "\n"
+
+    cut: int = text.rfind(" ", 0, limit)
+    if cut < limit // 2:
+        cut = limit
+
+    return text[:cut].strip() + "...\n"
+
+
+def _format_post(
     episode: dict[str, Any],
     podcast_name: str,
     max_title_length: int,
@@ -85,20 +127,10 @@ def format_mastodon_post(
     template_file: str,
 ) -> str:
     """Returns a formatted post with episode information."""
-    formatter: HTML2Text = HTML2Text()
-    formatter.ignore_emphasis = True
-    formatter.ignore_images = True
-    formatter.ignore_links = True
-    formatter.ignore_tables = True
-    formatter.body_width = 0
-
-    env: Environment = Environment(
-        loader=FileSystemLoader(template_path),
-        autoescape=select_autoescape(),
-        trim_blocks=True,
-        lstrip_blocks=True,
+    formatter: HTML2Text = _html_formatter()
+    template: Template = load_template(
+        template_path=template_path, template_file=template_file
     )
-    template: Template = env.get_template(template_file)
 
     # Replace "smart" quotes with regular quotes
     title: str = unsmart_quotes(text=episode["title"])
@@ -108,18 +140,15 @@ def format_mastodon_post(
     description: str = unsmart_quotes(text=episode["description"])
     formatted_description: str = formatter.handle(description)
 
-    # Fix issue with HTML2Text causing + to be rendered as \+
-    formatted_description = formatted_description.replace(r"\+", "+")
+    # HTML2Text always escapes a + at the start of a line as \+, so the
+    # escape is removed after formatting
+    if "\\+" in formatted_description:
+        formatted_description = _ESCAPED_PLUS.sub("+", formatted_description)
 
     # Normalize formatted description
     formatted_description = unicodedata.normalize("NFKC", formatted_description)
 
-    if len(formatted_description) > max_description_length:
-        formatted_description = (
-            f"{formatted_description[:max_description_length].strip()}...\n"
-        )
-    else:
-        formatted_description = f"{formatted_description.strip()}\n"
+    formatted_description = _truncate(formatted_description, max_description_length)
 
     return template.render(
         podcast_name=podcast_name,
@@ -130,6 +159,44 @@ def format_mastodon_post(
     )
 
 
+def format_bluesky_post(
+    episode: dict[str, Any],
+    podcast_name: str,
+    max_title_length: int,
+    max_description_length: int,
+    template_path: str,
+    template_file: str,
+) -> str:
+    """Returns a formatted Bluesky post with episode information."""
+    return _format_post(
+        episode=episode,
+        podcast_name=podcast_name,
+        max_title_length=max_title_length,
+        max_description_length=max_description_length,
+        template_path=template_path,
+        template_file=template_file,
+    )
+
+
+def format_mastodon_post(
+    episode: dict[str, Any],
+    podcast_name: str,
+    max_title_length: int,
+    max_description_length: int,
+    template_path: str,
+    template_file: str,
+) -> str:
+    """Returns a formatted Mastodon post with episode information."""
+    return _format_post(
+        episode=episode,
+        podcast_name=podcast_name,
+        max_title_length=max_title_length,
+        max_description_length=max_description_length,
+        template_path=template_path,
+        template_file=template_file,
+    )
+
+
 def timedelta_to_str(
     time_delta: timedelta,
     format_string: str = "{D:02}d {H:02}h {M:02}m {S:02}s",
@@ -164,26 +231,16 @@ def timedelta_to_str(
     # Convert tdelta to integer seconds.
     if input_type == "timedelta":
         remainder = int(time_delta.total_seconds())
-    elif input_type in ["s", "seconds"]:
-        remainder = int(time_delta)
-    elif input_type in ["m", "minutes"]:
-        remainder = int(time_delta) * 60
-    elif input_type in ["h", "hours"]:
-        remainder = int(time_delta) * 3600
-    elif input_type in ["d", "days"]:
-        remainder = int(time_delta) * 86400
-    elif input_type in ["w", "weeks"]:
-        remainder = int(time_delta) * 604800
-
-    f = Formatter()
-    desired_fields: list[str | None] = [
-        field_tuple[1] for field_tuple in f.parse(format_string)
-    ]
-    possible_fields = ("W", "D", "H", "M", "S")
-    constants: dict[str, int] = {"W": 604800, "D": 86400, "H": 3600, "M": 60, "S": 1}
+    else:
+        try:
+            remainder = int(time_delta) * _TD_INPUT_MULTIPLIERS[input_type]
+        except KeyError as e:
+            raise ValueError(f"Invalid input type: {input_type}") from e
+
+    desired_fields: frozenset[str] = _desired_fields(format_string)
     values: dict = {}
-    for field in possible_fields:
-        if field in desired_fields and field in constants:
-            values[field], remainder = divmod(remainder, constants[field])
+    for field, seconds in _TD_CONSTANTS:
+        if field in desired_fields:
+            values[field], remainder = divmod(remainder, seconds)
 
-    return f.format(format_string, **values)
+    return _TD_FORMATTER.format(format_string, **values)
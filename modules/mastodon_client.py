@@ -5,6 +5,8 @@
 # vim: set noai syntax=python ts=4 sw=4:
 """Mastodon Client Module."""
 
+import threading
+
 from mastodon import Mastodon
 
 
@@ -60,3 +62,25 @@ class MastodonClient:
             visibility=visibility,
             spoiler_text=spoiler_text,
         )
+
+
+_CLIENT_CACHE: dict[tuple[str, str], MastodonClient] = {}
+_CLIENT_CACHE_LOCK: threading.Lock = threading.Lock()
+
+
+def get_mastodon_client(
+    api_url: str,
+    client_secret: str | None = None,
+    access_token: str | None = None,
+) -> MastodonClient:
+    """Return a cached Mastodon client for an account, creating one if needed."""
+    _key: tuple[str, str] = (api_url, access_token)
+    with _CLIENT_CACHE_LOCK:
+        if _key not in _CLIENT_CACHE:
+            _CLIENT_CACHE[_key] = MastodonClient(
+                api_url=api_url,
+                client_secret=client_secret,
+                access_token=access_token,
+            )
+
+        return _CLIENT_CACHE[_key]
@@ -7,56 +7,149 @@
 """Podcast Feed Module."""
 
 import datetime
+import io
+from email.utils import format_datetime, parsedate_to_datetime
 from typing import Any
 
 import podcastparser
 import requests
-from dateutil import parser
-from dateutil.parser import ParserError
+from requests.adapters import HTTPAdapter
 
 from modules.settings import _DEFAULT_USER_AGENT
 
+_FEED_BUFFER_SIZE: int = 65536
+_SMALL_FEED_SIZE: int = 262144
+
+
+def _parse_http_date(value: str | None) -> datetime.datetime | None:
+    """Returns a timezone-aware datetime for an HTTP date header value."""
+    if not value:
+        return None
+
+    try:
+        _parsed: datetime.datetime = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if not _parsed.tzinfo:
+        return _parsed.replace(tzinfo=datetime.timezone.utc)
+
+    return _parsed
+
 
 class PodcastFeed:
     """Podcast Feed Fetcher."""
 
+    def __init__(self) -> None:
+        """Initialize HTTP session and podcast feed validators.
+
+        A single HTTP session is used for all requests so that connections
+        to the same host are kept alive and reused between requests.
+        """
+        self._session: requests.Session = requests.Session()
+        self._session.headers.update({"User-Agent": _DEFAULT_USER_AGENT})
+        _adapter: HTTPAdapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+        self._session.mount("https://", _adapter)
+        self._session.mount("http://", _adapter)
+
+        self._etags: dict[str, str] = {}
+        self._last_modified: dict[str, str] = {}
+
     def fetch(
         self,
         feed_url: str,
         max_episodes: int = 50,
         user_agent: str = _DEFAULT_USER_AGENT,
+        etag: str | None = None,
+        modified: datetime.datetime | None = None,
     ) -> list[dict[str, Any]] | None:
-        """Fetch items from the requested podcast feed."""
-        with requests.get(
-            url=feed_url, headers={"User-Agent": user_agent}, stream=True, timeout=30
+        """Fetch items from the requested podcast feed.
+
+        If an ETag or last modified date is provided, a conditional request
+        is made and None is returned if the feed has not been modified.
+        """
+        if modified and not modified.tzinfo:
+            modified = modified.replace(tzinfo=datetime.timezone.utc)
+
+        headers: dict[str, str] = {"User-Agent": user_agent}
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = format_datetime(
+                modified.astimezone(datetime.timezone.utc), usegmt=True
+            )
+
+        with self._session.get(
+            url=feed_url, headers=headers, stream=True, timeout=30
         ) as response:
-            response.raw.decode_content = True
+            _etag: str | None = response.headers.get("ETag")
+            _last_modified: str | None = response.headers.get("Last-Modified")
+
+            if response.status_code == 304:
+                # Not modified responses can leave out validators that have
+                # not changed
+                self._set_validators(
+                    feed_url=feed_url,
+                    etag=_etag or headers.get("If-None-Match"),
+                    last_modified=_last_modified or headers.get("If-Modified-Since"),
+                )
+                return None
+
+            self._set_validators(
+                feed_url=feed_url, etag=_etag, last_modified=_last_modified
+            )
+
+            # Servers that do not support conditional requests return the full
+            # feed, so the feed is only parsed if it is newer than requested
+            if modified:
+                _response_modified: datetime.datetime | None = _parse_http_date(
+                    _last_modified
+                )
+                if _response_modified and _response_modified <= modified:
+                    return None
+
+            # Small feeds are read in full before parsing. Larger feeds are
+            # parsed as they are streamed through a read buffer.
+            _content_length: str = response.headers.get("Content-Length", "")
+            _stream: io.BufferedIOBase
+            if _content_length.isdigit() and int(_content_length) < _SMALL_FEED_SIZE:
+                _stream = io.BytesIO(response.content)
+            else:
+                # Keep the raw stream open at EOF so that the buffered reader
+                # can report the end of the stream instead of failing
+                response.raw.decode_content = True
+                response.raw.auto_close = False
+                _stream = io.BufferedReader(response.raw, buffer_size=_FEED_BUFFER_SIZE)
+
             _feed: dict[str, Any] = podcastparser.parse(
-                url=feed_url, stream=response.raw, max_episodes=max_episodes
+                url=feed_url, stream=_stream, max_episodes=max_episodes
             )
 
         return _feed.get("episodes")
 
-    def last_modified(
-        self, feed_url: str, user_agent: str = _DEFAULT_USER_AGENT
-    ) -> datetime.datetime | None:
-        """Retrieve last modified date and time for the requested feed."""
-        feed: requests.Response = requests.head(
-            url=feed_url,
-            headers={"User-Agent": user_agent},
-            timeout=30,
-            allow_redirects=True,
+    def validators(self, feed_url: str) -> tuple[str | None, datetime.datetime | None]:
+        """Returns the ETag and last modified date from the last fetch of a feed."""
+        return self._etags.get(feed_url), _parse_http_date(
+            self._last_modified.get(feed_url)
         )
 
-        if feed and feed.status_code == 200:
-            _last_modified: str | None = feed.headers.get("Last-Modified", None)
-            if _last_modified:
-                try:
-                    return parser.parse(_last_modified)
-                except ParserError:
-                    return datetime.datetime.now(datetime.timezone.utc)
+    def _set_validators(
+        self, feed_url: str, etag: str | None, last_modified: str | None
+    ) -> None:
+        """Store the ETag and last modified values for a feed."""
+        if etag:
+            self._etags[feed_url] = etag
+        else:
+            self._etags.pop(feed_url, None)
+
+        if last_modified:
+            self._last_modified[feed_url] = last_modified
+        else:
+            self._last_modified.pop(feed_url, None)
 
-        return datetime.datetime.now(datetime.timezone.utc)
+    def close(self) -> None:
+        """Close the HTTP session and any open connections."""
+        self._session.close()
 
     def __str__(self):
         return self.__class__.__name__
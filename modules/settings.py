@@ -5,23 +5,49 @@
 # vim: set noai syntax=python ts=4 sw=4:
 """Application Configuration Module."""
 import json
+import re
 import sys
+from dataclasses import dataclass
 from pathlib import Path
-from typing import NamedTuple, Any
+from typing import Any
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 _DEFAULT_USER_AGENT = (
     "Mozilla/5.0 (X11; Linux x86_64; rv:132.0) Gecko/20100101 Firefox/134.0"
 )
+_DEFAULT_DATABASE_FILE = "dbfiles/feed_info.sqlite3"
+_DEFAULT_LOG_FILE = "logs/app.log"
+_DEFAULT_TEMPLATE_PATH = "templates"
+_DEFAULT_BLUESKY_API_URL = "https://bsky.social"
+_DEFAULT_BLUESKY_SESSION_FILE = "dbfiles/bluesky_session.sqlite3"
+_DEFAULT_BLUESKY_TEMPLATE_FILE = "post-bluesky.txt.jinja"
+_DEFAULT_MASTODON_TEMPLATE_FILE = "post-mastodon.txt.jinja"
+
 
+def _get_str(settings: dict[str, Any], key: str, default: str | None) -> str | None:
+    """Returns a stripped string setting value or the default if not set."""
+    _value: Any = settings.get(key)
+    if _value is None:
+        return default
 
-class BlueskySettings(NamedTuple):
+    return str(_value).strip()
+
+
+@dataclass(slots=True, frozen=True)
+class BlueskySettings:
     """Bluesky Client Settings."""
 
     enabled: bool
     "Enable support for posting podcast episodes to Bluesky."
-    username: str
+    username: str | None
     "Bluesky account username, excluding the @ prefix."
-    app_password: str
+    app_password: str | None
     "Bluesky account app password."
     session_file: str
     "Path to the SQLite3 database for storing Bluesky session tokens."
@@ -39,12 +65,13 @@ class BlueskySettings(NamedTuple):
     "Maximum podcast episode description length."
 
 
-class MastodonSettings(NamedTuple):
+@dataclass(slots=True, frozen=True)
+class MastodonSettings:
     """Mastodon Client Settings."""
 
     enabled: bool
     "Enable support for posting podcast episodes to Mastodon."
-    api_url: str
+    api_url: str | None
     "Mastodon API base URL."
     use_oauth: bool
     "Use OAuth authentication."
@@ -64,7 +91,8 @@ class MastodonSettings(NamedTuple):
     "Maximum podcast episode description length."
 
 
-class FeedSettings(NamedTuple):
+@dataclass(slots=True, frozen=True)
+class FeedSettings:
     """Podcast Feed Settings."""
 
     name: str
@@ -81,20 +109,23 @@ class FeedSettings(NamedTuple):
     "Process a maximum number of episodes from the feed."
     guid_filter: str
     "String used to filter out specific podcast episode GUIDs."
+    guid_filter_re: re.Pattern | None
+    "Compiled case-insensitive pattern for the GUID filter, if set."
     bluesky_settings: BlueskySettings | None
     "Settings for posting to Bluesky."
     mastodon_settings: MastodonSettings | None
     "Settings for posting to Mastodon."
 
 
-class AppSettings(NamedTuple):
+@dataclass(slots=True, frozen=True)
+class AppSettings:
     """Application Settings."""
 
-    database_file: str = "dbfiles/feed_info.sqlite3"
+    database_file: str = _DEFAULT_DATABASE_FILE
     "Path to the SQLite database for storing podcast episode information."
     database_clean_days: int = 90
     "Clean database entries that are older than the given number of days."
-    log_file: str = "logs/app.log"
+    log_file: str = _DEFAULT_LOG_FILE
     "Path to the file to be used for logging."
     user_agent: str = _DEFAULT_USER_AGENT
     "Browser user agent string used when retrieving podcast feeds."
@@ -102,9 +133,23 @@ class AppSettings(NamedTuple):
     "List of podcast feeds."
 
 
+_REQUIRED_FEED_KEYS: dict[str, str] = {
+    "name": "Missing or blank podcast name.",
+    "short_name": "Missing or blank podcast short name.",
+    "feed_url": "Missing or blank podcast feed URL.",
+}
+"Required podcast feed settings keys and the error message for blank values."
+
+
 class AppConfig:
     """Application Configuration Settings."""
 
+    def __init__(self) -> None:
+        """Class initialization method."""
+        # Parsed application settings, keyed by the settings file path, size
+        # and modification time so that a changed file is parsed again
+        self._app_settings_cache: dict[tuple[str, int, int], AppSettings] = {}
+
     def parse_bluesky(self, bluesky_settings: dict[str, Any]) -> BlueskySettings | None:
         """Parse Bluesky settings from a dictionary."""
 
@@ -112,29 +157,32 @@ class AppConfig:
             return None
 
         _enabled: bool = bool(bluesky_settings.get("enabled", True))
-        _username: str | None = bluesky_settings.get("username", None)
+        _username: str | None = _get_str(bluesky_settings, "username", None)
+        if _username:
+            _username = _username.lstrip("@")
+
         if _enabled and not _username:
             raise ValueError("Missing or blank Bluesky username.")
 
-        _app_password: str | None = bluesky_settings.get("app_password", None)
+        _app_password: str | None = _get_str(bluesky_settings, "app_password", None)
         if _enabled and not _app_password:
             raise ValueError("Missing or blank Bluesky app password.")
 
         return BlueskySettings(
             enabled=_enabled,
-            username=_username.strip().lstrip("@"),
-            app_password=_app_password.strip(),
-            session_file=str(
-                bluesky_settings.get(
-                    "bluesky_session_file", "dbfiles/bluesky_session.sqlite3"
-                )
-            ).strip(),
+            username=_username,
+            app_password=_app_password,
+            session_file=_get_str(
+                bluesky_settings, "bluesky_session_file", _DEFAULT_BLUESKY_SESSION_FILE
+            ),
             use_session_token=bool(bluesky_settings.get("use_session_token", False)),
-            api_url=bluesky_settings.get("api_url", "https://bsky.social").strip(),
-            template_path=bluesky_settings.get("template_path", "templates").strip(),
-            template_file=bluesky_settings.get(
-                "template_file", "post-bluesky.txt.jinja"
-            ).strip(),
+            api_url=_get_str(bluesky_settings, "api_url", _DEFAULT_BLUESKY_API_URL),
+            template_path=_get_str(
+                bluesky_settings, "template_path", _DEFAULT_TEMPLATE_PATH
+            ),
+            template_file=_get_str(
+                bluesky_settings, "template_file", _DEFAULT_BLUESKY_TEMPLATE_FILE
+            ),
             max_title_length=int(bluesky_settings.get("max_title_length", 100)),
             max_description_length=int(
                 bluesky_settings.get("max_description_length", 150)
@@ -150,14 +198,14 @@ class AppConfig:
             return None
 
         _enabled: bool = bool(mastodon_settings.get("enabled", True))
-        _api_url: str | None = mastodon_settings.get("api_url", None)
+        _api_url: str | None = _get_str(mastodon_settings, "api_url", None)
         if _enabled and not _api_url:
             raise ValueError("Missing or blank Mastodon API URL.")
 
         _use_oauth: bool = mastodon_settings.get("use_oauth", False)
-        _secrets_file: str | None = mastodon_settings.get("secrets_file", None)
-        _client_secret: str | None = mastodon_settings.get("client_secret", None)
-        _access_token: str | None = mastodon_settings.get("access_token", None)
+        _secrets_file: str | None = _get_str(mastodon_settings, "secrets_file", None)
+        _client_secret: str | None = _get_str(mastodon_settings, "client_secret", None)
+        _access_token: str | None = _get_str(mastodon_settings, "access_token", None)
 
         if _enabled and (_use_oauth and not _secrets_file):
             raise ValueError(
@@ -172,15 +220,17 @@ class AppConfig:
 
         return MastodonSettings(
             enabled=_enabled,
-            api_url=_api_url.strip(),
+            api_url=_api_url,
             use_oauth=_use_oauth,
-            secrets_file=_secrets_file.strip(),
-            client_secret=_client_secret.strip(),
-            access_token=_access_token.strip(),
-            template_path=mastodon_settings.get("template_path", "templates").strip(),
-            template_file=mastodon_settings.get(
-                "template_file", "post-mastodon.txt.jinja"
-            ).strip(),
+            secrets_file=_secrets_file,
+            client_secret=_client_secret,
+            access_token=_access_token,
+            template_path=_get_str(
+                mastodon_settings, "template_path", _DEFAULT_TEMPLATE_PATH
+            ),
+            template_file=_get_str(
+                mastodon_settings, "template_file", _DEFAULT_MASTODON_TEMPLATE_FILE
+            ),
             max_title_length=int(mastodon_settings.get("max_title_length", 100)),
             max_description_length=int(
                 mastodon_settings.get("max_description_length", 275)
@@ -212,26 +262,32 @@ class AppConfig:
                 "Either Bluesky or Mastodon settings are required."
             )
 
-        _name: str | None = feed_settings.get("name", None)
-        if not _name:
-            raise ValueError("Missing or blank podcast name.")
+        _feed_strings: dict[str, Any] = {
+            key: (
+                feed_settings[key].strip()
+                if isinstance(feed_settings.get(key), str)
+                else feed_settings.get(key)
+            )
+            for key in _REQUIRED_FEED_KEYS
+        }
 
-        _short_name: str | None = feed_settings.get("short_name", None)
-        if not _short_name:
-            raise ValueError("Missing or blank podcast short name.")
+        for key, message in _REQUIRED_FEED_KEYS.items():
+            if not _feed_strings[key]:
+                raise ValueError(message)
 
-        _feed_url: str | None = feed_settings.get("feed_url", None)
-        if not _feed_url:
-            raise ValueError("Missing or blank podcast feed URL.")
+        _guid_filter: str = _get_str(feed_settings, "guid_filter", "")
 
         return FeedSettings(
-            name=_name.strip(),
-            short_name=_short_name.strip(),
-            feed_url=_feed_url.strip(),
+            **_feed_strings,
             enabled=bool(feed_settings.get("enabled", True)),
             recent_days=int(feed_settings.get("recent_days", 5)),
             max_episodes=int(feed_settings.get("max_episodes", 20)),
-            guid_filter=str(feed_settings.get("guid_filter", "")).strip(),
+            guid_filter=_guid_filter,
+            guid_filter_re=(
+                re.compile(re.escape(_guid_filter), re.IGNORECASE)
+                if _guid_filter
+                else None
+            ),
             bluesky_settings=_bluesky_settings,
             mastodon_settings=_mastodon_settings,
         )
@@ -240,15 +296,30 @@ class AppConfig:
         """Parse application configuration file."""
 
         settings_path = Path.cwd() / settings_file
-        with settings_path.open(mode="r", encoding="utf-8") as _settings_file:
-            _app_settings = json.load(_settings_file)
-            if not _app_settings:
-                print("ERROR: Application settings JSON file could not be parsed.")
-                sys.exit(1)
+        _stat = settings_path.stat()
+        _key: tuple[str, int, int] = (
+            str(settings_path),
+            _stat.st_size,
+            _stat.st_mtime_ns,
+        )
+        if _key not in self._app_settings_cache:
+            self._app_settings_cache[_key] = self._parse_app_file(
+                settings_path=settings_path
+            )
+
+        return self._app_settings_cache[_key]
+
+    def _parse_app_file(self, settings_path: Path) -> AppSettings:
+        """Parse application configuration file contents."""
 
-            if not isinstance(_app_settings, dict):
-                print("ERROR: Application settings JSON file is not valid.")
-                sys.exit(1)
+        _app_settings = _json_loads(settings_path.read_bytes())
+        if not _app_settings:
+            print("ERROR: Application settings JSON file could not be parsed.")
+            sys.exit(1)
+
+        if not isinstance(_app_settings, dict):
+            print("ERROR: Application settings JSON file is not valid.")
+            sys.exit(1)
 
         if "feeds" not in _app_settings:
             raise ValueError("Podcast feeds setting is not been defined.")
@@ -265,16 +336,15 @@ class AppConfig:
             raise ValueError("Podcast feeds setting could not be parsed.")
 
         return AppSettings(
-            database_file=str(
-                _app_settings.get("database_file", "dbfiles/feed_info.sqlite3")
-            ).strip(),
+            database_file=_get_str(
+                _app_settings, "database_file", _DEFAULT_DATABASE_FILE
+            ),
             database_clean_days=int(_app_settings.get("database_clean_days", 90)),
-            log_file=str(_app_settings.get("log_file", "logs/app.log")).strip(),
-            user_agent=str(
-                _app_settings.get("user_agent", _DEFAULT_USER_AGENT)
-            ).strip(),
+            log_file=_get_str(_app_settings, "log_file", _DEFAULT_LOG_FILE),
+            user_agent=_get_str(_app_settings, "user_agent", _DEFAULT_USER_AGENT),
             feeds=_feeds_settings,
         )
 
     def __str__(self) -> str:
         return self.__class__.__name__
+
@@ -7,21 +7,26 @@
 
 import datetime
 import logging
+import re
+import sys
 from argparse import Namespace
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import takewhile
 from pprint import pformat
 from typing import Any
 
 from atproto_client.exceptions import RequestException
 
 import modules.command
-from modules.bluesky_client import BlueskyClient
+from modules.bluesky_client import BlueskyClient, close_clients, get_client
 from modules.database import FeedDatabase
 from modules.formatting import (
     format_bluesky_post,
     format_mastodon_post,
+    load_template,
     timedelta_to_str,
 )
-from modules.mastodon_client import MastodonClient
+from modules.mastodon_client import MastodonClient, get_mastodon_client
 from modules.podcast_feed import PodcastFeed
 from modules.settings import _DEFAULT_USER_AGENT, AppConfig, AppSettings, FeedSettings
 
@@ -29,6 +34,17 @@ APP_VERSION: str = "1.3.0"
 logger: logging.Logger = logging.getLogger(__name__)
 
 
+class FeedLoggerAdapter(logging.LoggerAdapter):
+    """Logger adapter that prefixes messages with the feed short name."""
+
+    def process(self, msg: Any, kwargs: Any) -> tuple[Any, Any]:
+        """Prefix the log message with the feed short name, if set."""
+        if self.extra.get("feed_name"):
+            return f"[{self.extra['feed_name']}] {msg}", kwargs
+
+        return msg, kwargs
+
+
 def configure_logging(
     log_file: str = "logs/app.log", debug: bool = False
 ) -> logging.FileHandler:
@@ -51,24 +67,74 @@ def retrieve_new_episodes(
     feed_episodes: list[dict[str, Any]],
     feed_database: FeedDatabase,
     feed_name: str = None,
-    guid_filter: str = "",
+    guid_filter: re.Pattern | None = None,
     days: int = 7,
     dry_run: bool = False,
 ) -> list[dict[str, Any]]:
     """Retrieve new episodes from a podcast feed."""
-    seen_guids: list[str] = feed_database.retrieve_guids(feed_name=feed_name)
-    seen_enclosure_urls: list[str] = feed_database.retrieve_enclosure_urls(
-        feed_name=feed_name
+    feed_logger: FeedLoggerAdapter = FeedLoggerAdapter(logger, {"feed_name": feed_name})
+
+    # Episodes are compared against the same cutoff and recorded with the
+    # same processed timestamp
+    now_utc: datetime.datetime = datetime.datetime.now(datetime.timezone.utc)
+    cutoff: float = (
+        datetime.datetime.now() - datetime.timedelta(days=days)
+    ).timestamp()
+
+    # Feed episodes are sorted newest first, except for serial podcasts which
+    # are sorted oldest first. For feeds sorted newest first, stop at the
+    # first episode that is older than the cutoff.
+    recent_episodes: list[dict[str, Any]]
+    if (
+        feed_episodes
+        and feed_episodes[0]["published"] >= feed_episodes[-1]["published"]
+    ):
+        recent_episodes = list(
+            takewhile(lambda episode: episode["published"] >= cutoff, feed_episodes)
+        )
+    else:
+        recent_episodes = [
+            episode for episode in feed_episodes if episode["published"] >= cutoff
+        ]
+
+    # Use guid_filter to match against the episode GUID to filter out any
+    # random or incorrect GUIDs. This is a workaround to reduce issues
+    # encountered with American Public Media feeds
+    if guid_filter is not None:
+        recent_episodes = [
+            episode
+            for episode in recent_episodes
+            if guid_filter.search(episode["guid"])
+        ]
+
+    # Only look up the GUIDs and enclosure URLs of recent episodes, rather
+    # than every GUID and enclosure URL stored for the podcast
+    seen_guids: set[str]
+    seen_enclosure_urls: set[str]
+    seen_guids, seen_enclosure_urls = feed_database.retrieve_seen(
+        guids=(episode["guid"] for episode in recent_episodes),
+        enclosure_urls=(episode["enclosures"][0]["url"] for episode in recent_episodes),
+        feed_name=feed_name,
     )
 
-    logger.debug("Seen GUIDs:\n%s", pformat(seen_guids, compact=True))
-    logger.debug("Seen Enclosure URLs:\n%s", pformat(seen_enclosure_urls, compact=True))
+    if feed_logger.isEnabledFor(logging.DEBUG):
+        feed_logger.debug("Seen GUIDs:\n%s", pformat(seen_guids, compact=True))
+        feed_logger.debug(
+            "Seen Enclosure URLs:\n%s", pformat(seen_enclosure_urls, compact=True)
+        )
 
     episodes: list[dict[str, Any]] = []
+    processed_episodes: list[tuple[str, str | None, str, datetime.datetime]] = []
 
-    for episode in feed_episodes:
+    for episode in recent_episodes:
         guid: str = episode["guid"]
-        enclosure_url: str = episode["enclosures"][0]["url"].strip()
+
+        # Only process episodes in which the GUID or the enclosure URL are not
+        # in the episodes database table
+        enclosure_url: str = episode["enclosures"][0]["url"]
+        if guid in seen_guids and enclosure_url in seen_enclosure_urls:
+            continue
+
         publish_date: datetime.datetime = datetime.datetime.fromtimestamp(
             episode["published"]
         )
@@ -78,203 +144,338 @@ def retrieve_new_episodes(
         total_time_str: str = timedelta_to_str(
             time_delta=total_time, format_string="{H}h {M}m {S}s"
         )
+        info: dict[str, Any] = {
+            "guid": guid,
+            "published": publish_date,
+            "title": episode["title"],
+            "total_time": total_time_str,
+            "total_time_delta": total_time,
+            "url": enclosure_url,
+        }
+
+        if "description_html" in episode:
+            info["description"] = episode["description_html"].strip()
+        else:
+            info["description"] = episode["description"]
+
+        episodes.append(info)
+        if feed_logger.isEnabledFor(logging.DEBUG):
+            feed_logger.debug(
+                "Episode info for GUID %s:\n%s",
+                guid,
+                pformat(info, sort_dicts=False, compact=True),
+            )
 
-        if datetime.datetime.now() - publish_date <= datetime.timedelta(days=days):
-            # Only process episodes in which the GUID or the enclosure URL are
-            # not in the episodes database table
-            if guid not in seen_guids or enclosure_url not in seen_enclosure_urls:
-                # Use guid_filter to match against the episode GUID to filter
-                # out any random or incorrect GUIDs. This is a workaround to
-                # reduce issues encountered with American Public Media feeds
-                if guid_filter is not None and guid_filter.lower() in guid.lower():
-                    info: dict[str, Any] = {
-                        "guid": guid,
-                        "published": publish_date,
-                        "title": episode["title"].strip(),
-                        "total_time": total_time_str,
-                        "total_time_delta": total_time,
-                        "url": enclosure_url,
-                    }
-
-                    if "description_html" in episode:
-                        info["description"] = episode["description_html"].strip()
-                    else:
-                        info["description"] = episode["description"].strip()
-
-                    episodes.append(info)
-                    logger.debug(
-                        "Episode info for GUID %s:\n%s",
-                        guid,
-                        pformat(info, sort_dicts=False, compact=True),
-                    )
+        if not dry_run:
+            # Only add the enclosure URL if it's not already in the episodes
+            # table to prevent duplicate entries.
+            processed_episodes.append(
+                (
+                    guid,
+                    enclosure_url if enclosure_url not in seen_enclosure_urls else None,
+                    feed_name,
+                    now_utc,
+                )
+            )
 
-                    if not dry_run:
-                        # Only add the enclosure URL if it's not already in
-                        # the episodes table to prevent duplicate entries.
-                        if enclosure_url not in seen_enclosure_urls:
-                            feed_database.insert(
-                                guid=guid,
-                                enclosure_url=enclosure_url,
-                                feed_name=feed_name,
-                                timestamp=datetime.datetime.now(datetime.timezone.utc),
-                            )
-                        else:
-                            feed_database.insert(
-                                guid=guid,
-                                feed_name=feed_name,
-                                timestamp=datetime.datetime.now(datetime.timezone.utc),
-                            )
+    feed_database.insert_many(processed_episodes)
 
     return episodes
 
 
-def process_feeds(
-    feeds: list[FeedSettings],
-    feed_database: FeedDatabase,
-    user_agent: str = _DEFAULT_USER_AGENT,
+def post_bluesky_episode(
+    bluesky_client: BlueskyClient | bool,
+    feed: FeedSettings,
+    episode: dict[str, Any],
     dry_run: bool = False,
-):
-    """Process podcast feeds and post new episodes."""
-    for feed in feeds:
-        logger.info("Podcast Name: %s", feed.name)
+) -> None:
+    """Format and post a podcast episode to Bluesky."""
+    feed_logger: FeedLoggerAdapter = FeedLoggerAdapter(
+        logger, {"feed_name": feed.short_name}
+    )
 
-        if not feed.enabled:
-            logger.info("Feed disabled. Skipping.")
-            continue
+    post_text: str = format_bluesky_post(
+        podcast_name=feed.name,
+        episode=episode,
+        max_title_length=feed.bluesky_settings.max_title_length,
+        max_description_length=feed.bluesky_settings.max_description_length,
+        template_path=feed.bluesky_settings.template_path,
+        template_file=feed.bluesky_settings.template_file,
+    )
 
-        # Pull episodes from the configured podcast feed
-        podcast: PodcastFeed = PodcastFeed()
+    if dry_run:
+        feed_logger.debug("Bluesky Post Text: %s", post_text)
+        return
 
-        logger.debug("Feed URL: %s", feed.feed_url)
+    feed_logger.info("Bluesky: Posting %s", post_text)
+    bluesky_client.post(body=post_text, episode_url=episode["url"])
+    if feed.bluesky_settings.use_session_token:
+        bluesky_client.save_session()
 
-        # Check to see if the podcast feed has been updated since the
-        # last run. Only process the feed of the feed has been updated.
-        previous_last_modified: datetime.datetime | None = (
-            feed_database.get_last_modified(feed_name=feed.name)
-        )
-        current_last_modified: datetime.datetime | None = podcast.last_modified(
-            feed_url=feed.feed_url
-        )
 
-        logger.debug(
-            "Previous Last Modified: %s",
-            previous_last_modified if previous_last_modified else "N/A",
-        )
-        logger.debug("Current Last Modified: %s", current_last_modified)
-
-        if (
-            previous_last_modified
-            and current_last_modified
-            and (
-                previous_last_modified
-                and current_last_modified <= previous_last_modified
-            )
-        ):
-            logger.debug("Feed has not been updated since last run.")
-            continue
+def post_mastodon_episode(
+    mastodon_client: MastodonClient | bool,
+    feed: FeedSettings,
+    episode: dict[str, Any],
+    dry_run: bool = False,
+) -> None:
+    """Format and post a podcast episode to Mastodon."""
+    feed_logger: FeedLoggerAdapter = FeedLoggerAdapter(
+        logger, {"feed_name": feed.short_name}
+    )
 
-        episodes: list[dict[str, Any]] = podcast.fetch(
-            feed_url=feed.feed_url,
-            max_episodes=feed.max_episodes,
-            user_agent=user_agent,
-        )
+    post_text: str = format_mastodon_post(
+        podcast_name=feed.name,
+        episode=episode,
+        max_title_length=feed.mastodon_settings.max_title_length,
+        max_description_length=feed.mastodon_settings.max_description_length,
+        template_path=feed.mastodon_settings.template_path,
+        template_file=feed.mastodon_settings.template_file,
+    )
 
-        if episodes:
-            new_episodes: list[dict[str, Any]] = retrieve_new_episodes(
-                feed_episodes=episodes,
-                feed_database=feed_database,
-                feed_name=feed.short_name,
-                guid_filter=feed.guid_filter,
-                days=feed.recent_days,
-                dry_run=dry_run,
-            )
-            new_episodes.reverse()
+    if dry_run:
+        feed_logger.debug("Mastodon Post Text: %s", post_text)
+        return
 
-            logger.debug("New Episodes:\n%s", pformat(new_episodes))
+    feed_logger.info("Mastodon: Posting %s", post_text)
+    mastodon_client.post(content=post_text)
 
-            if not new_episodes:
-                logger.info("No new episodes.")
-                continue
 
-            bluesky_client: BlueskyClient | bool = False
-            if feed.bluesky_settings.enabled and not dry_run:
-                try:
-                    # Setup Bluesky Client
-                    logger.debug("Bluesky API URL: %s", feed.bluesky_settings.api_url)
-                    bluesky_client = BlueskyClient(
-                        api_url=feed.bluesky_settings.api_url,
-                        username=feed.bluesky_settings.username,
-                        app_password=feed.bluesky_settings.app_password,
-                        session_file=feed.bluesky_settings.session_file,
-                        use_session_token=feed.bluesky_settings.use_session_token,
-                    )
-                except RequestException as at_except:
-                    logger.info("Unable to connect to Bluesky:\n%s", at_except)
-                    bluesky_client = False
-            elif feed.bluesky_settings.enabled and dry_run:
-                bluesky_client = True
-
-            mastodon_client: MastodonClient | bool = False
-            if feed.mastodon_settings.enabled and not dry_run:
-                # Connect to Mastodon Client
-                logger.debug("Mastodon API URL: %s", feed.mastodon_settings.api_url)
-                if feed.mastodon_settings.use_oauth:
-                    mastodon_client = MastodonClient(
-                        api_url=feed.mastodon_settings.api_url,
-                        client_secret=None,
-                        access_token=feed.mastodon_settings.secrets_file,
-                    )
-                else:
-                    mastodon_client = MastodonClient(
-                        api_url=feed.mastodon_settings.api_url,
-                        client_secret=feed.mastodon_settings.client_secret,
-                        access_token=feed.mastodon_settings.access_token,
+def post_episodes(
+    feed: FeedSettings,
+    episodes: list[dict[str, Any]],
+    bluesky_enabled: bool = False,
+    mastodon_enabled: bool = False,
+    dry_run: bool = False,
+) -> None:
+    """Post new podcast episodes to the enabled Bluesky and Mastodon accounts."""
+    feed_logger: FeedLoggerAdapter = FeedLoggerAdapter(
+        logger, {"feed_name": feed.short_name}
+    )
+
+    bluesky_client: BlueskyClient | bool = False
+    if bluesky_enabled and not dry_run:
+        try:
+            # Setup Bluesky Client
+            feed_logger.debug("Bluesky API URL: %s", feed.bluesky_settings.api_url)
+            bluesky_client = get_client(
+                api_url=feed.bluesky_settings.api_url,
+                username=feed.bluesky_settings.username,
+                app_password=feed.bluesky_settings.app_password,
+                session_file=feed.bluesky_settings.session_file,
+                use_session_token=feed.bluesky_settings.use_session_token,
+            )
+        except RequestException as at_except:
+            feed_logger.info("Unable to connect to Bluesky:\n%s", at_except)
+            bluesky_client = False
+    elif bluesky_enabled and dry_run:
+        bluesky_client = True
+
+    mastodon_client: MastodonClient | bool = False
+    if mastodon_enabled and not dry_run:
+        # Connect to Mastodon Client
+        feed_logger.debug("Mastodon API URL: %s", feed.mastodon_settings.api_url)
+        if feed.mastodon_settings.use_oauth:
+            mastodon_client = get_mastodon_client(
+                api_url=feed.mastodon_settings.api_url,
+                client_secret=None,
+                access_token=feed.mastodon_settings.secrets_file,
+            )
+        else:
+            mastodon_client = get_mastodon_client(
+                api_url=feed.mastodon_settings.api_url,
+                client_secret=feed.mastodon_settings.client_secret,
+                access_token=feed.mastodon_settings.access_token,
+            )
+    elif mastodon_enabled and dry_run:
+        mastodon_client = True
+
+    # Load post templates before posting any episodes
+    if bluesky_client:
+        load_template(
+            template_path=feed.bluesky_settings.template_path,
+            template_file=feed.bluesky_settings.template_file,
+        )
+
+    if mastodon_client:
+        load_template(
+            template_path=feed.mastodon_settings.template_path,
+            template_file=feed.mastodon_settings.template_file,
+        )
+
+    # Bluesky and Mastodon posts for an episode are published
+    # concurrently. Each episode is completed before moving on to the
+    # next episode to keep episodes posted in order.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for episode in reversed(episodes):
+            feed_logger.debug("Episode Details: %s", episode)
+            posts: list[Future] = []
+            if bluesky_client:
+                posts.append(
+                    executor.submit(
+                        post_bluesky_episode,
+                        bluesky_client=bluesky_client,
+                        feed=feed,
+                        episode=episode,
+                        dry_run=dry_run,
                     )
-            elif feed.mastodon_settings.enabled and dry_run:
-                mastodon_client = True
-
-            for episode in new_episodes:
-                logger.debug("Episode Details: %s", episode)
-                if bluesky_client and feed.bluesky_settings.enabled:
-                    post_text: str = format_bluesky_post(
-                        podcast_name=feed.name,
+                )
+
+            if mastodon_client:
+                posts.append(
+                    executor.submit(
+                        post_mastodon_episode,
+                        mastodon_client=mastodon_client,
+                        feed=feed,
                         episode=episode,
-                        max_title_length=feed.bluesky_settings.max_title_length,
-                        max_description_length=feed.bluesky_settings.max_description_length,
-                        template_path=feed.bluesky_settings.template_path,
-                        template_file=feed.bluesky_settings.template_file,
+                        dry_run=dry_run,
                     )
+                )
 
-                    if dry_run:
-                        logger.debug("Bluesky Post Text: %s", post_text)
+            for post in posts:
+                post.result()
 
-                    if not dry_run:
-                        logger.info("Bluesky: Posting %s", post_text)
-                        bluesky_client.post(body=post_text, episode_url=episode["url"])
-                        if feed.bluesky_settings.use_session_token:
-                            bluesky_client.save_session()
 
-                if mastodon_client and feed.mastodon_settings.enabled:
-                    post_text: str = format_mastodon_post(
-                        podcast_name=feed.name,
-                        episode=episode,
-                        max_title_length=feed.mastodon_settings.max_title_length,
-                        max_description_length=feed.mastodon_settings.max_description_length,
-                        template_path=feed.mastodon_settings.template_path,
-                        template_file=feed.mastodon_settings.template_file,
-                    )
+def process_feed(
+    feed: FeedSettings,
+    feed_database: FeedDatabase,
+    podcast: PodcastFeed,
+    user_agent: str = _DEFAULT_USER_AGENT,
+    dry_run: bool = False,
+) -> None:
+    """Process a podcast feed and post new episodes."""
+    feed_logger: FeedLoggerAdapter = FeedLoggerAdapter(
+        logger, {"feed_name": feed.short_name}
+    )
+    feed_logger.info("Podcast Name: %s", feed.name)
+
+    if not feed.enabled:
+        feed_logger.info("Feed disabled. Skipping.")
+        return
 
-                    if dry_run:
-                        logger.debug("Mastodon Post Text: %s", post_text)
+    bluesky_enabled: bool = bool(
+        feed.bluesky_settings and feed.bluesky_settings.enabled
+    )
+    mastodon_enabled: bool = bool(
+        feed.mastodon_settings and feed.mastodon_settings.enabled
+    )
+    if not bluesky_enabled and not mastodon_enabled:
+        feed_logger.info("No Bluesky or Mastodon posting enabled for feed. Skipping.")
+        return
 
-                    if not dry_run:
-                        logger.info("Mastodon: Posting %s", post_text)
-                        mastodon_client.post(content=post_text)
+    # Pull episodes from the configured podcast feed
+    feed_logger.debug("Feed URL: %s", feed.feed_url)
 
-        if not dry_run:
+    # Request the podcast feed using the ETag and last modified date
+    # stored from the last run. Only process the feed if the feed has
+    # been updated.
+    previous: dict[str, Any] = feed_database.get_conditional_headers(
+        feed_name=feed.short_name
+    )
+    feed_logger.debug("Previous ETag: %s", previous["etag"] or "N/A")
+    feed_logger.debug("Previous Last Modified: %s", previous["modified"] or "N/A")
+
+    episodes: list[dict[str, Any]] | None = podcast.fetch(
+        feed_url=feed.feed_url,
+        max_episodes=feed.max_episodes,
+        user_agent=user_agent,
+        etag=previous["etag"],
+        modified=previous["modified"],
+    )
+
+    current_etag: str | None
+    current_last_modified: datetime.datetime | None
+    current_etag, current_last_modified = podcast.validators(feed_url=feed.feed_url)
+    feed_logger.debug("Current ETag: %s", current_etag or "N/A")
+    feed_logger.debug("Current Last Modified: %s", current_last_modified or "N/A")
+
+    if episodes is None:
+        feed_logger.debug("Feed has not been updated since last run.")
+        if not dry_run and current_etag != previous["etag"]:
             feed_database.upsert_last_modified(
-                feed_name=feed.short_name, last_modified=current_last_modified
+                feed_name=feed.short_name,
+                last_modified=current_last_modified or previous["modified"],
+                etag=current_etag,
             )
+        return
+
+    if episodes:
+        new_episodes: list[dict[str, Any]] = retrieve_new_episodes(
+            feed_episodes=episodes,
+            feed_database=feed_database,
+            feed_name=feed.short_name,
+            guid_filter=feed.guid_filter_re,
+            days=feed.recent_days,
+            dry_run=dry_run,
+        )
+        if feed_logger.isEnabledFor(logging.DEBUG):
+            feed_logger.debug("New Episodes:\n%s", pformat(new_episodes))
+
+        if new_episodes:
+            post_episodes(
+                feed=feed,
+                episodes=new_episodes,
+                bluesky_enabled=bluesky_enabled,
+                mastodon_enabled=mastodon_enabled,
+                dry_run=dry_run,
+            )
+        else:
+            feed_logger.info("No new episodes.")
+
+    if not dry_run:
+        feed_database.upsert_last_modified(
+            feed_name=feed.short_name,
+            last_modified=current_last_modified,
+            etag=current_etag,
+        )
+
+
+def process_feeds(
+    feeds: list[FeedSettings],
+    feed_database: FeedDatabase,
+    user_agent: str = _DEFAULT_USER_AGENT,
+    dry_run: bool = False,
+) -> int:
+    """Process podcast feeds and post new episodes.
+
+    Feeds are processed concurrently since processing a feed is mostly
+    spent waiting on requests to the podcast feed and posting services.
+    A single podcast feed fetcher is shared by all feeds so that HTTP
+    connections are reused across feeds hosted on the same server.
+
+    Errors raised while processing a feed are logged and do not stop
+    other feeds from being processed. Returns the number of feeds that
+    could not be processed.
+    """
+    if not feeds:
+        return 0
+
+    failed_feeds: int = 0
+
+    podcast: PodcastFeed = PodcastFeed()
+    try:
+        with ThreadPoolExecutor(max_workers=min(8, len(feeds))) as executor:
+            results: list[Future] = [
+                executor.submit(
+                    process_feed,
+                    feed=feed,
+                    feed_database=feed_database,
+                    podcast=podcast,
+                    user_agent=user_agent,
+                    dry_run=dry_run,
+                )
+                for feed in feeds
+            ]
+            for feed, result in zip(feeds, results):
+                try:
+                    result.result()
+                except Exception:
+                    logger.exception("[%s] Error processing feed.", feed.short_name)
+                    failed_feeds += 1
+    finally:
+        podcast.close()
+
+    return failed_feeds
 
 
 def main() -> None:
@@ -302,7 +503,7 @@ def main() -> None:
     if dry_run:
         logger.info("Running in dry mode.")
 
-    process_feeds(
+    failed_feeds: int = process_feeds(
         feeds=app_settings.feeds,
         feed_database=feed_database,
         user_agent=app_settings.user_agent,
@@ -313,9 +514,15 @@ def main() -> None:
     if not dry_run and not arguments.skip_clean:
         feed_database.clean(days_to_keep=app_settings.database_clean_days)
 
+    close_clients()
+    feed_database.close()
+
     log_handler.close()
     logger.removeHandler(log_handler)
 
+    if failed_feeds:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()